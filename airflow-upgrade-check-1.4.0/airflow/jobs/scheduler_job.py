@@ -168,6 +168,8 @@ class DagFileProcessor(AbstractDagFileProcessor, LoggingMixin, MultiprocessingSt
             raise
         finally:
             result_channel.close()
+            stdout.flush()
+            stderr.flush()
             sys.stdout = sys.__stdout__
             sys.stderr = sys.__stderr__
             # We re-initialized the ORM within this Process above so we need to
@@ -22,10 +22,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
+import os
 import re
 import logging
 import sys
+import threading
 import warnings
+import weakref
 
 import six
 
@@ -33,6 +37,17 @@ from builtins import object
 from contextlib import contextmanager
 from logging import Handler, StreamHandler
 
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+try:
+    from logging.handlers import QueueListener
+    from queue import Queue
+except ImportError:  # Python 2
+    QueueListener = Queue = None
+
 # 7-bit C1 ANSI escape sequences
 ANSI_ESCAPE = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
 
@@ -45,6 +60,130 @@ def remove_escape_codes(text):
     return ANSI_ESCAPE.sub("", text)
 
 
+class _LoggerDispatchHandler(Handler):
+    """
+    Hands the ``(logger, record)`` pairs dequeued by the stream listener back
+    to the logger they were created for, so that its level, filters and
+    handlers are applied as usual.
+    """
+    dispatching = threading.local()
+    # Held while a record is handed to the logger, and around os.fork(), so
+    # that a forked child never inherits a handler lock taken by the listener
+    lock = threading.Lock()
+
+    def handle(self, item):
+        logger, record = item
+        self.dispatching.active = True
+        try:
+            with self.lock:
+                if logger.isEnabledFor(record.levelno):
+                    logger.handle(record)
+        except Exception:
+            # Letting it through would stop the listener thread, and leave
+            # every later flush waiting for a queue nobody consumes.
+            self.dispatching.failed = True
+            try:
+                self.handleError(record)
+            finally:
+                self.dispatching.failed = False
+        finally:
+            self.dispatching.active = False
+        return True
+
+    def emit(self, record):
+        pass
+
+
+if hasattr(os, "register_at_fork"):  # Python 3.7+
+    os.register_at_fork(
+        before=_LoggerDispatchHandler.lock.acquire,
+        after_in_parent=_LoggerDispatchHandler.lock.release,
+        after_in_child=_LoggerDispatchHandler.lock.release,
+    )
+
+
+class _FlushStreamLogWriters(logging.Filter):
+    """
+    Propagates the lines held by the StreamLogWriters of a handler before it
+    emits any other record, so that printed output keeps its order relative
+    to log calls, including the ones made on child loggers (e.g. the
+    operators' ``self.log``) or on the root logger.
+    """
+    def __init__(self):
+        super(_FlushStreamLogWriters, self).__init__()
+        self.writers = weakref.WeakSet()
+
+    @classmethod
+    def register(cls, writer):
+        # Every handler the records of the writer's logger go through
+        logger = writer.logger
+        while logger is not None:
+            for handler in logger.handlers:
+                for log_filter in handler.filters:
+                    if isinstance(log_filter, cls):
+                        break
+                else:
+                    log_filter = cls()
+                    handler.addFilter(log_filter)
+                log_filter.writers.add(writer)
+            logger = logger.parent if logger.propagate else None
+
+    def filter(self, record):
+        # Records dispatched by the listener were written through a writer
+        if not getattr(_LoggerDispatchHandler.dispatching, "active", False):
+            for writer in list(self.writers):
+                writer._flush_lines(blocking=False)
+        return True
+
+
+# Number of seconds a flush waits at most for the listener to emit the queued
+# records, so that a stuck handler cannot keep the process from exiting
+LOG_QUEUE_JOIN_TIMEOUT = 5.0
+
+_log_queue = None
+_log_listener = None
+_log_listener_pid = None
+
+
+def _stop_log_listener():
+    global _log_queue, _log_listener
+
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+        # Anything written after this, e.g. while logging.shutdown() flushes
+        # the handlers, is dispatched synchronously instead of being queued
+        # with no thread left to consume it.
+        _log_queue = _log_listener = None
+
+
+def _get_log_queue(start=True):
+    """
+    Returns the queue consumed by the background thread dispatching the
+    records written to a StreamLogWriter, starting that thread on first use
+    unless ``start`` is False.
+
+    Returns None on Python 2, where records are dispatched synchronously, and
+    once the listener has been stopped at exit.
+    """
+    global _log_queue, _log_listener, _log_listener_pid
+
+    if QueueListener is None:
+        return None
+
+    # The listener thread does not survive a fork, so every process
+    # (e.g. a DagFileProcessor or a forked task runner) starts its own.
+    if _log_listener_pid != os.getpid():
+        if not start:
+            return None
+        if _log_listener_pid is None:
+            atexit.register(_stop_log_listener)
+        _log_queue = Queue()
+        _log_listener = QueueListener(_log_queue, _LoggerDispatchHandler())
+        _log_listener.start()
+        _log_listener_pid = os.getpid()
+    return _log_queue
+
+
 class LoggingMixin(object):
     """
     Convenience super-class to have a logger configured with the class name
@@ -86,14 +225,52 @@ class StreamLogWriter(object):
     """
     encoding = None
 
-    def __init__(self, logger, level):
+    def __init__(self, logger, level, max_buffer_bytes=8192, flush_interval=1.0):
         """
         :param log: The log level method to write to, ie. log.debug, log.warning
+        :param max_buffer_bytes: size of the buffer above which complete lines
+            are propagated to the logger
+        :param flush_interval: number of seconds after which complete lines
+            are propagated to the logger, regardless of the buffer size
         :return:
         """
         self.logger = logger
         self.level = level
-        self._buffer = str()
+        self._buffer = []
+        self._buffer_len = 0
+        self._newline_pending = False
+        self._max_buffer_bytes = max_buffer_bytes
+        self._flush_interval = flush_interval
+        self._last_flush_ts = monotonic()
+        self._flush_timer = None
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        if isinstance(logger, logging.Logger):
+            _FlushStreamLogWriters.register(self)
+
+    @property
+    def buffer(self):
+        """
+        Returns the pending, not yet propagated, output as a single string.
+        """
+        return "".join(self._buffer)
+
+    def _reset_buffer(self, remainder=""):
+        self._buffer = [remainder] if remainder else []
+        self._buffer_len = len(remainder)
+        self._newline_pending = False
+
+    def _check_fork(self):
+        # A forked child, e.g. the task runner forking within
+        # redirect_stdout(ti.log), inherits the writer of its parent. The
+        # output held at that time is the parent's to emit, and the lock or
+        # the flush timer may belong to a thread which did not survive.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.RLock()
+            self._flush_timer = None
+            self._reset_buffer()
+            self._last_flush_ts = monotonic()
 
     def close(self):
         """
@@ -116,28 +293,143 @@ class StreamLogWriter(object):
     def _propagate_log(self, message):
         """
         Propagate message removing escape codes.
+
+        The record is handed to a background listener thread, so that the
+        writer does not block on the I/O of the logger's handlers.
         """
-        self.logger.log(self.level, remove_escape_codes(message))
+        message = remove_escape_codes(message)
+        log_queue = _get_log_queue()
+        if log_queue is None:
+            self.logger.log(self.level, message)
+        else:
+            # Point the record at this frame, as logger.log() would have done
+            fn, lno, func = self.logger.findCaller()[:3]
+            log_queue.put_nowait((self.logger, self.logger.makeRecord(
+                self.logger.name, self.level, fn, lno, message, None, None, func
+            )))
+        self._last_flush_ts = monotonic()
+
+    def _should_propagate(self):
+        return self._buffer_len >= self._max_buffer_bytes or \
+            monotonic() - self._last_flush_ts >= self._flush_interval
+
+    def _take_lines(self):
+        """
+        Removes the complete lines from the buffer and returns them.
+        """
+        buffer = self.buffer
+        idx = buffer.rfind("\n")
+        self._reset_buffer(buffer[idx + 1:])
+        return buffer[:idx].rstrip()
+
+    def _schedule_flush(self):
+        # Held lines must not wait for the next write, which may never come
+        if self._flush_timer is None:
+            delay = self._flush_interval - (monotonic() - self._last_flush_ts)
+            self._flush_timer = threading.Timer(max(delay, 0), self._on_flush_timer)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _on_flush_timer(self):
+        with self._lock:
+            self._flush_timer = None
+            if self._newline_pending:
+                self._propagate_log(self._take_lines())
+
+    def _flush_lines(self, blocking=True):
+        """
+        Propagates the complete lines held in the buffer and waits for the
+        listener to emit them.
+
+        Unless ``blocking``, nothing is propagated while another thread holds
+        the lock: that thread is writing to this stream concurrently with the
+        caller, and waiting for it could deadlock when records are not queued.
+        """
+        self._check_fork()
+        if self._lock.acquire(blocking):
+            try:
+                if self._newline_pending:
+                    self._propagate_log(self._take_lines())
+            finally:
+                self._lock.release()
+        self._join_log_queue()
+
+    @staticmethod
+    def _join_log_queue():
+        # Wait for the listener to emit everything queued so far, unless this
+        # is called by one of the handlers running on the listener thread.
+        log_queue = _get_log_queue(start=False)
+        if log_queue is None or getattr(_LoggerDispatchHandler.dispatching, "active", False):
+            return
+        # Same as log_queue.join(), but bounded by LOG_QUEUE_JOIN_TIMEOUT
+        deadline = monotonic() + LOG_QUEUE_JOIN_TIMEOUT
+        with log_queue.all_tasks_done:
+            while log_queue.unfinished_tasks:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                log_queue.all_tasks_done.wait(remaining)
 
     def write(self, message):
         """
-        Do whatever it takes to actually log the specified logging record
+        Do whatever it takes to actually log the specified logging record.
+
+        Complete lines are accumulated and propagated to the logger in a single
+        record once the buffer grows beyond ``max_buffer_bytes`` or
+        ``flush_interval`` seconds have passed since the last propagation.
+
         :param message: message to log
         """
-        if not message.endswith("\n"):
-            self._buffer += message
-        else:
-            self._buffer += message
-            self._propagate_log(self._buffer.rstrip())
-            self._buffer = str()
+        # Output written below the logger's effective level would be discarded
+        # by the logger anyway, so don't spend any time buffering it.
+        if not self.logger.isEnabledFor(self.level):
+            return
+        if getattr(_LoggerDispatchHandler.dispatching, "failed", False):
+            # The listener is reporting an error of the logger's handlers, so
+            # don't feed the report back into them.
+            sys.__stderr__.write(message)
+            return
+        self._check_fork()
+
+        # Lines are propagated within the lock, so that the ones taken by the
+        # flush timer cannot be overtaken by the ones written after them.
+        with self._lock:
+            self._buffer_len += len(message)
+
+            if message.endswith("\n") and self._should_propagate():
+                # Most writes end a line, in which case everything pending is
+                # made of complete lines and there is no need to look for the
+                # last one.
+                if self._buffer:
+                    self._buffer.append(message)
+                    message = self.buffer
+                self._reset_buffer()
+                self._propagate_log(message.rstrip())
+                return
+
+            self._buffer.append(message)
+            if "\n" in message:
+                self._newline_pending = True
+
+            if self._newline_pending:
+                if self._should_propagate():
+                    self._propagate_log(self._take_lines())
+                else:
+                    self._schedule_flush()
 
     def flush(self):
         """
         Ensure all logging output has been flushed
         """
-        if len(self._buffer) > 0:
-            self._propagate_log(self._buffer)
-            self._buffer = str()
+        self._check_fork()
+        with self._lock:
+            if self._buffer_len > 0:
+                message = self.buffer
+                if message.endswith("\n"):
+                    message = message.rstrip()
+                self._reset_buffer()
+                self._propagate_log(message)
+        self._join_log_queue()
 
     def isatty(self):
         """
@@ -180,6 +472,7 @@ def redirect_stdout(logger, level):
         sys.stdout = writer
         yield
     finally:
+        writer.flush()
         sys.stdout = sys.__stdout__
 
 
@@ -190,6 +483,7 @@ def redirect_stderr(logger, level):
         sys.stderr = writer
         yield
     finally:
+        writer.flush()
         sys.stderr = sys.__stderr__
 
 
@@ -199,16 +493,24 @@ def set_context(logger, value):
     :param logger: logger
     :param value: value to set
     """
+    handlers = []
     _logger = logger
     while _logger:
-        for handler in _logger.handlers:
-            try:
-                handler.set_context(value)
-            except AttributeError:
-                # Not all handlers need to have context passed in so we ignore
-                # the error when handlers do not have set_context defined.
-                pass
-        if _logger.propagate is True:
-            _logger = _logger.parent
-        else:
-            _logger = None
+        handlers.extend(_logger.handlers)
+        if _logger.propagate is not True:
+            break
+        _logger = _logger.parent
+
+    seen = set()
+    for handler in handlers:
+        # A handler shared by several loggers of the tree only needs its
+        # context set once.
+        if id(handler) in seen:
+            continue
+        seen.add(id(handler))
+        try:
+            handler.set_context(value)
+        except AttributeError:
+            # Not all handlers need to have context passed in so we ignore
+            # the error when handlers do not have set_context defined.
+            pass
@@ -17,37 +17,31 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import logging
+import unittest
 import warnings
 
 import six
 
 from airflow.operators.bash_operator import BashOperator
+from airflow.utils.log import logging_mixin
 from airflow.utils.log.logging_mixin import set_context, StreamLogWriter
 from tests.compat import mock
 
-if six.PY2:
-    # Need `assertWarns` back-ported from unittest2
-    import unittest2 as unittest
-else:
-    import unittest
-
 
 class TestLoggingMixin(unittest.TestCase):
-    def setUp(self):
-        warnings.filterwarnings(
-            action='always'
-        )
-
     def test_log(self):
         op = BashOperator(
             task_id='task-1',
             bash_command='exit 0'
         )
-        with self.assertWarns(DeprecationWarning) as cm:
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
             op.logger.info('Some arbitrary line')
-        warning = cm.warning
+        self.assertEqual(len(w), 1)
+        self.assertIs(w[0].category, DeprecationWarning)
         assert 'Initializing logger for airflow.operators.bash_operator.BashOperator' \
-            ' using logger(), which will be replaced by .log in Airflow 2.0' == str(warning.args[0])
+            ' using logger(), which will be replaced by .log in Airflow 2.0' == str(w[0].message)
 
     def test_set_context(self):
         handler1 = mock.MagicMock()
@@ -66,56 +60,183 @@ class TestLoggingMixin(unittest.TestCase):
         handler1.set_context.assert_called_with(value)
         handler2.set_context.assert_called_with(value)
 
-    def tearDown(self):
-        warnings.resetwarnings()
+    def test_set_context_shared_handler(self):
+        handler = mock.MagicMock()
+        parent = mock.MagicMock()
+        parent.propagate = False
+        parent.handlers = [handler, ]
+        log = mock.MagicMock()
+        log.handlers = [handler, ]
+        log.parent = parent
+        log.propagate = True
+
+        value = "test"
+        set_context(log, value)
+
+        handler.set_context.assert_called_once_with(value)
 
 
 class TestStreamLogWriter(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('airflow.utils.log.logging_mixin._get_log_queue')
+        self.get_log_queue = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Freeze the clock, so that only the tests below let time pass
+        patcher = mock.patch('airflow.utils.log.logging_mixin.monotonic', return_value=0.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('airflow.utils.log.logging_mixin.threading.Timer')
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.logger = mock.MagicMock()
+        self.logger.findCaller.return_value = (__file__, 1, "test", None)
+        self.logger.makeRecord.side_effect = logging.LogRecord
+        self.get_log_queue.return_value.unfinished_tasks = 0
+        self.log = StreamLogWriter(self.logger, 1)
+
+    def _queued(self):
+        queued = []
+        for call in self.get_log_queue.return_value.put_nowait.call_args_list:
+            logger, record = call[0][0]
+            self.assertIs(logger, self.logger)
+            queued.append((record.levelno, record.msg))
+        return queued
+
     def test_write(self):
-        logger = mock.MagicMock()
-        logger.log = mock.MagicMock()
+        msg = "test_message"
+        self.log.write(msg)
+
+        self.assertEqual(self.log.buffer, msg)
+
+        self.log.write(" \n")
+        self.log.write("second_message\n")
+        self.assertEqual(self._queued(), [])
 
-        log = StreamLogWriter(logger, 1)
+        self.log.flush()
+        self.assertEqual(self._queued(), [(1, msg + " \nsecond_message")])
+
+        self.assertEqual(self.log.buffer, "")
+
+    def test_write_max_buffer_bytes(self):
+        log = StreamLogWriter(self.logger, 1, max_buffer_bytes=16)
+
+        log.write("test_message\n")
+        self.assertEqual(self._queued(), [])
+
+        log.write("second_message\nthird")
+        self.assertEqual(self._queued(), [(1, "test_message\nsecond_message")])
+
+        self.assertEqual(log.buffer, "third")
+
+    def test_write_flush_interval(self):
+        log = StreamLogWriter(self.logger, 1, flush_interval=0)
 
         msg = "test_message"
         log.write(msg)
-
-        self.assertEqual(log._buffer, msg)
+        self.assertEqual(self._queued(), [])
 
         log.write(" \n")
-        logger.log.assert_called_once_with(1, msg)
+        self.assertEqual(self._queued(), [(1, msg)])
 
-        self.assertEqual(log._buffer, "")
+        self.assertEqual(log.buffer, "")
 
-    def test_flush(self):
-        logger = mock.MagicMock()
-        logger.log = mock.MagicMock()
+    def test_write_flush_timer(self):
+        self.log.write("test_message\nsecond")
+        self.assertEqual(self._queued(), [])
+        self.timer.assert_called_once_with(1.0, self.log._on_flush_timer)
+        self.timer.return_value.start.assert_called_once_with()
+
+        self.log.write("_message\n")
+        self.timer.assert_called_once()
+
+        self.monotonic.return_value = 1.0
+        self.log._on_flush_timer()
+        self.assertEqual(self._queued(), [(1, "test_message\nsecond_message")])
+        self.assertEqual(self.log.buffer, "")
 
-        log = StreamLogWriter(logger, 1)
+        self.log.write("third_message\n")
+        self.assertEqual(self.timer.call_count, 2)
 
+    def test_write_single_line_fastpath(self):
+        log = StreamLogWriter(self.logger, 1, flush_interval=0)
+
+        log.write("test_message\n")
+        self.assertEqual(self._queued(), [(1, "test_message")])
+
+        self.assertEqual(log._buffer, [])
+        self.assertEqual(log.buffer, "")
+
+    def test_write_disabled(self):
+        self.logger.isEnabledFor.return_value = False
+        log = StreamLogWriter(self.logger, 1, flush_interval=0)
+
+        log.write("test_message\n")
+        self.assertEqual(log.buffer, "")
+
+        log.flush()
+        self.assertEqual(self._queued(), [])
+
+    def test_write_enabled_later(self):
+        self.logger.isEnabledFor.return_value = False
+        log = StreamLogWriter(self.logger, 1, flush_interval=0)
+
+        log.write("test_message\n")
+        self.logger.isEnabledFor.return_value = True
+        log.write("second_message\n")
+        self.assertEqual(self._queued(), [(1, "second_message")])
+
+    def test_flush(self):
         msg = "test_message"
 
-        log.write(msg)
-        self.assertEqual(log._buffer, msg)
+        self.log.write(msg)
+        self.assertEqual(self.log.buffer, msg)
+
+        self.log.flush()
+        self.assertEqual(self._queued(), [(1, msg)])
+        self.get_log_queue.return_value.all_tasks_done.__enter__.assert_called_once_with()
+
+        self.assertEqual(self.log.buffer, "")
+
+    def test_flush_timeout(self):
+        log_queue = self.get_log_queue.return_value
+        log_queue.unfinished_tasks = 1
+        self.monotonic.side_effect = [0.0, 1.0, logging_mixin.LOG_QUEUE_JOIN_TIMEOUT]
+
+        self.log.flush()
+        log_queue.all_tasks_done.wait.assert_called_once_with(
+            logging_mixin.LOG_QUEUE_JOIN_TIMEOUT - 1.0)
+
+    @mock.patch('airflow.utils.log.logging_mixin.os.getpid')
+    def test_write_after_fork(self, getpid):
+        getpid.return_value = 1
+        log = StreamLogWriter(self.logger, 1)
+        log.write("parent_message\n")
+        lock = log._lock
+
+        getpid.return_value = 2
+        log.write("child_message\n")
+        self.assertIsNot(log._lock, lock)
+        self.assertEqual(log.buffer, "child_message\n")
+        self.assertEqual(self.timer.call_count, 2)
 
         log.flush()
-        logger.log.assert_called_once_with(1, msg)
+        self.assertEqual(self._queued(), [(1, "child_message")])
 
-        self.assertEqual(log._buffer, "")
+    def test_flush_without_listener(self):
+        self.get_log_queue.return_value = None
 
-    def test_isatty(self):
-        logger = mock.MagicMock()
-        logger.log = mock.MagicMock()
+        msg = "test_message"
 
-        log = StreamLogWriter(logger, 1)
-        self.assertFalse(log.isatty())
+        self.log.write(msg)
+        self.log.flush()
+        self.logger.log.assert_called_once_with(1, msg)
 
-    def test_encoding(self):
-        logger = mock.MagicMock()
-        logger.log = mock.MagicMock()
+    def test_isatty(self):
+        self.assertFalse(self.log.isatty())
 
-        log = StreamLogWriter(logger, 1)
-        self.assertIsNone(log.encoding)
+    def test_encoding(self):
+        self.assertIsNone(self.log.encoding)
 
     def test_iobase_compatibility(self):
         log = StreamLogWriter(None, 1)
@@ -123,3 +244,106 @@ class TestStreamLogWriter(unittest.TestCase):
         self.assertFalse(log.closed)
         # has no specific effect
         log.close()
+
+
+@unittest.skipIf(six.PY2, "QueueListener is not available on Python 2")
+class TestStreamLogWriterListener(unittest.TestCase):
+    def test_flush_dispatches_to_logger_handlers(self):
+        handler = mock.MagicMock()
+        handler.level = logging.NOTSET
+        logger = logging.Logger("airflow.test_stream_log_writer")
+        logger.addHandler(handler)
+
+        log = StreamLogWriter(logger, logging.WARNING)
+        log.write("test_message\n")
+        log.flush()
+
+        handler.handle.assert_called_once()
+        record = handler.handle.call_args[0][0]
+        self.assertEqual(record.getMessage(), "test_message")
+        self.assertEqual(record.levelno, logging.WARNING)
+        self.assertEqual(record.filename, "logging_mixin.py")
+
+    def test_direct_log_after_write(self):
+        handler = logging.Handler()
+        handler.emit = mock.MagicMock()
+        logger = logging.Logger("airflow.test_stream_log_writer_ordering")
+        logger.addHandler(handler)
+
+        log = StreamLogWriter(logger, logging.WARNING)
+        log.write("printed_message\nsecond")
+        logger.warning("direct_message")
+
+        self.assertEqual(
+            [call[0][0].getMessage() for call in handler.emit.call_args_list],
+            ["printed_message", "direct_message"],
+        )
+        self.assertEqual(log.buffer, "second")
+
+    def test_child_log_after_write(self):
+        handler = logging.Handler()
+        handler.emit = mock.MagicMock()
+        logger = logging.Logger("airflow.test_stream_log_writer_ordering")
+        logger.addHandler(handler)
+        child = logging.Logger("airflow.test_stream_log_writer_ordering.child")
+        child.parent = logger
+
+        log = StreamLogWriter(logger, logging.WARNING)
+        log.write("printed_message\n")
+        child.warning("child_message")
+
+        self.assertEqual(
+            [call[0][0].getMessage() for call in handler.emit.call_args_list],
+            ["printed_message", "child_message"],
+        )
+
+    def test_flush_dispatches_to_unregistered_logger(self):
+        handler = mock.MagicMock()
+        handler.level = logging.NOTSET
+        logger = logging.Logger("airflow.test_stream_log_writer_unregistered")
+        logger.addHandler(handler)
+
+        log = StreamLogWriter(logger, logging.WARNING)
+        log.write("test_message\n")
+        log.flush()
+
+        handler.handle.assert_called_once()
+        self.assertEqual(handler.handle.call_args[0][0].getMessage(), "test_message")
+
+    @mock.patch.object(logging_mixin._LoggerDispatchHandler, "handleError")
+    def test_flush_after_handler_error(self, handle_error):
+        handler = mock.MagicMock()
+        handler.level = logging.NOTSET
+        handler.handle.side_effect = [ValueError(), True]
+        logger = logging.Logger("airflow.test_stream_log_writer_error")
+        logger.addHandler(handler)
+
+        log = StreamLogWriter(logger, logging.WARNING)
+        log.write("first\n")
+        log.flush()
+        log.write("second\n")
+        log.flush()
+
+        handle_error.assert_called_once()
+        self.assertEqual(handler.handle.call_args[0][0].getMessage(), "second")
+
+    def test_write_after_listener_stopped(self):
+        handler = mock.MagicMock()
+        handler.level = logging.NOTSET
+        logger = logging.Logger("airflow.test_stream_log_writer_stopped")
+        logger.addHandler(handler)
+
+        with mock.patch.multiple(logging_mixin, _log_queue=None, _log_listener=None,
+                                 _log_listener_pid=None):
+            log = StreamLogWriter(logger, logging.WARNING)
+            log.write("first\n")
+            log.flush()
+            logging_mixin._stop_log_listener()
+
+            log.write("second\n")
+            log.flush()
+
+        self.assertEqual(
+            [call[0][0].getMessage() for call in handler.handle.call_args_list],
+            ["first", "second"],
+        )
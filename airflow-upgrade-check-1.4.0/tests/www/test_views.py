@@ -18,21 +18,19 @@
 # under the License.
 
 import io
-import copy
 import json
 import logging.config
 import sys
 
 import os
+import re
 import shutil
-import urllib
 
 import pytest
 import tempfile
 import unittest
 
 import six
-from flask._compat import PY2
 
 from airflow.operators.bash_operator import BashOperator
 from airflow.utils import timezone
@@ -41,74 +39,199 @@ from parameterized import parameterized
 from tests.compat import mock
 
 from six.moves.urllib.parse import quote_plus
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+from sqlalchemy.util import ThreadLocalRegistry
 from werkzeug.test import Client
 from werkzeug.wrappers import BaseResponse
 
 
 import airflow
-from airflow import models
+from airflow import models, settings
 from airflow.configuration import conf
 from airflow.config_templates.airflow_local_settings import DEFAULT_LOGGING_CONFIG
+from airflow.logging_config import configure_logging
 from airflow.models import DAG, DagRun, TaskInstance
 from airflow.models.renderedtifields import RenderedTaskInstanceFields as RTIF
 from airflow.models.serialized_dag import SerializedDagModel
 from airflow.operators.dummy_operator import DummyOperator
-from airflow.settings import Session
 from airflow.utils.timezone import datetime
 from airflow.www import app as application
 
 from tests.test_utils.config import conf_vars
 
 
-class TestChartModelView(unittest.TestCase):
+def _disable_sqlite_sync(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.close()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def sqlite_without_sync():
+    """
+    Stops SQLite from waiting for its writes to reach the disk while the
+    module runs, as the database is only scratch space for these tests.
+    """
+    if settings.engine.dialect.name != 'sqlite':
+        yield
+        return
+    event.listen(settings.engine, 'connect', _disable_sqlite_sync)
+    # Connections to SQLite files are not pooled, but drop any that would be
+    # so that every connection of the module goes through the listener
+    settings.engine.dispose()
+    yield
+    event.remove(settings.engine, 'connect', _disable_sqlite_sync)
+    settings.engine.dispose()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seed_airflow_user(sqlite_without_sync):
+    """
+    Creates the ``airflow`` user needed by the chart, known event and variable
+    import views once for the whole module.
+    """
+    with create_session() as session:
+        session.query(models.User).delete()
+        session.add(models.User(username='airflow'))
+    yield
+    with create_session() as session:
+        session.query(models.User).delete()
+
+
+_app = None
+
+
+def _get_app():
+    """
+    Returns the webserver app shared by the tests of the module, only creating
+    it on first use. Each test class still makes its own test client.
+    """
+    global _app
+    if _app is None:
+        _app = application.create_app(testing=True)
+        _app.config['WTF_CSRF_METHODS'] = []
+    return _app
+
+
+def _restart_savepoint(session, transaction):
+    if transaction.nested and not transaction._parent.nested:
+        session.begin_nested()
+
+
+def _truncate(session, *tables):
+    """
+    Empties the tables of the given models, in a single TRUNCATE on PostgreSQL
+    and with a DELETE per table on the other backends. Sessions bound to the
+    transaction of a ``TransactionalTestCase`` always DELETE, as a TRUNCATE
+    could not be rolled back with it on every backend.
+    """
+    if isinstance(session.bind, Engine) and session.bind.dialect.name == 'postgresql':
+        session.execute('TRUNCATE TABLE {} RESTART IDENTITY'.format(
+            ', '.join(table.__tablename__ for table in tables)))
+    else:
+        for table in tables:
+            session.query(table).delete()
+    session.commit()
+
+
+class TransactionalTestCase(unittest.TestCase):
+    """
+    Runs every test of the class in a SAVEPOINT of a single transaction, which
+    is rolled back after each test instead of deleting the rows it created.
+
+    All the sessions handed out by ``settings.Session`` and by the
+    ``Session`` the app's model views were given are bound to that
+    transaction and only ever commit or roll back a SAVEPOINT of their own.
+    They are built by the factory of ``settings.Session``, so they keep its
+    ``expire_on_commit=False`` and committing does not make the objects of a
+    test reload their rows.
+    """
+
+    # Models whose tables are emptied once for the class, within its transaction
+    CLEARED_TABLES = ()
+
+    @classmethod
+    def setUpClass(cls):
+        super(TransactionalTestCase, cls).setUpClass()
+        cls.connection = settings.engine.connect()
+        cls.transaction = cls.connection.begin()
+        # pysqlite does not emit BEGIN, so SQLite starts its transaction with
+        # the first SAVEPOINT and commits when it is released. Keeping one
+        # open for the whole class makes every other SAVEPOINT a nested one.
+        cls.class_savepoint = cls.connection.begin_nested()
+        # airflow.www.app imported settings.Session by name, so it keeps the
+        # old one once settings.configure_orm() replaced it (as other test
+        # modules do). Both hand out the sessions bound to the connection.
+        registry = ThreadLocalRegistry(cls._create_session)
+        cls._session_registries = []
+        for scoped_session in {settings.Session, application.Session}:
+            scoped_session.remove()
+            cls._session_registries.append((scoped_session, scoped_session.registry))
+            scoped_session.registry = registry
+        if cls.CLEARED_TABLES:
+            _truncate(settings.Session(), *cls.CLEARED_TABLES)
+            settings.Session.remove()
 
+    @classmethod
+    def _create_session(cls):
+        session = settings.Session.session_factory(bind=cls.connection)
+        session.begin_nested()
+        event.listen(session, 'after_transaction_end', _restart_savepoint)
+        return session
+
+    def setUp(self):
+        super(TransactionalTestCase, self).setUp()
+        self.savepoint = self.connection.begin_nested()
+
+    def tearDown(self):
+        settings.Session.remove()
+        self.savepoint.rollback()
+        super(TransactionalTestCase, self).tearDown()
+
+    @classmethod
+    def tearDownClass(cls):
+        settings.Session.remove()
+        for scoped_session, registry in cls._session_registries:
+            scoped_session.registry = registry
+        cls.class_savepoint.rollback()
+        cls.transaction.rollback()
+        cls.connection.close()
+        super(TransactionalTestCase, cls).tearDownClass()
+
+
+class TestChartModelView(TransactionalTestCase):
+
+    CLEARED_TABLES = (models.Chart,)
     CREATE_ENDPOINT = '/admin/chart/new/?url=/admin/chart/'
 
     @classmethod
     def setUpClass(cls):
         super(TestChartModelView, cls).setUpClass()
-        session = Session()
-        session.query(models.Chart).delete()
-        session.query(models.User).delete()
-        session.commit()
-        user = models.User(username='airflow')
-        session.add(user)
-        session.commit()
-        session.close()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.__exit__(None, None, None)
+        super(TestChartModelView, cls).tearDownClass()
 
     def setUp(self):
         super(TestChartModelView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
+        self.session = settings.Session()
         self.chart = {
             'label': 'chart',
             'owner': 'airflow',
             'conn_id': 'airflow_db',
         }
 
-    def tearDown(self):
-        self.session.query(models.Chart).delete()
-        self.session.commit()
-        self.session.close()
-        super(TestChartModelView, self).tearDown()
-
-    @classmethod
-    def tearDownClass(cls):
-        session = Session()
-        session.query(models.User).delete()
-        session.commit()
-        session.close()
-        super(TestChartModelView, cls).tearDownClass()
-
     def test_create_chart(self):
         response = self.app.post(
             self.CREATE_ENDPOINT,
             data=self.chart,
-            follow_redirects=True,
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
         self.assertEqual(self.session.query(models.Chart).count(), 1)
 
     def test_get_chart(self):
@@ -120,44 +243,39 @@ class TestChartModelView(unittest.TestCase):
         self.assertIn('Sort by Owner', response.data.decode('utf-8'))
 
 
-class TestVariableView(unittest.TestCase):
+class TestVariableView(TransactionalTestCase):
 
+    CLEARED_TABLES = (models.Variable,)
     CREATE_ENDPOINT = '/admin/variable/new/?url=/admin/variable/'
+    XSS_URL = "/admin/airflow/variables/asdf<img%20src=''%20onerror='alert(1);'>"
 
     @classmethod
     def setUpClass(cls):
         super(TestVariableView, cls).setUpClass()
-        session = Session()
-        session.query(models.Variable).delete()
-        session.commit()
-        session.close()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.__exit__(None, None, None)
+        super(TestVariableView, cls).tearDownClass()
 
     def setUp(self):
         super(TestVariableView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
+        self.session = settings.Session()
         self.variable = {
             'key': 'test_key',
             'val': 'text_val',
             'is_encrypted': True
         }
 
-    def tearDown(self):
-        self.session.query(models.Variable).delete()
-        self.session.commit()
-        self.session.close()
-        super(TestVariableView, self).tearDown()
-
     def test_can_handle_error_on_decrypt(self):
         # create valid variable
         response = self.app.post(
             self.CREATE_ENDPOINT,
             data=self.variable,
-            follow_redirects=True,
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
 
         # update the variable with a wrong value, given that is encrypted
         Var = models.Variable
@@ -175,10 +293,8 @@ class TestVariableView(unittest.TestCase):
         self.assertEqual(self.session.query(models.Variable).count(), 1)
 
     def test_xss_prevention(self):
-        xss = "/admin/airflow/variables/asdf<img%20src=''%20onerror='alert(1);'>"
-
         response = self.app.get(
-            xss,
+            self.XSS_URL,
             follow_redirects=True,
         )
         self.assertEqual(response.status_code, 404)
@@ -186,29 +302,29 @@ class TestVariableView(unittest.TestCase):
                          response.data.decode("utf-8"))
 
 
-class TestKnownEventView(unittest.TestCase):
+class TestKnownEventView(TransactionalTestCase):
 
+    CLEARED_TABLES = (models.KnownEvent,)
     CREATE_ENDPOINT = '/admin/knownevent/new/?url=/admin/knownevent/'
 
     @classmethod
     def setUpClass(cls):
         super(TestKnownEventView, cls).setUpClass()
-        session = Session()
-        session.query(models.KnownEvent).delete()
-        session.query(models.User).delete()
-        session.commit()
-        user = models.User(username='airflow')
-        session.add(user)
-        session.commit()
-        cls.user_id = user.id
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+        session = settings.Session()
+        cls.user_id = session.query(models.User.id) \
+            .filter(models.User.username == 'airflow').scalar()
         session.close()
 
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.__exit__(None, None, None)
+        super(TestKnownEventView, cls).tearDownClass()
+
     def setUp(self):
         super(TestKnownEventView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
+        self.session = settings.Session()
         self.known_event = {
             'label': 'event-label',
             'event_type': '1',
@@ -218,27 +334,12 @@ class TestKnownEventView(unittest.TestCase):
             'description': '',
         }
 
-    def tearDown(self):
-        self.session.query(models.KnownEvent).delete()
-        self.session.commit()
-        self.session.close()
-        super(TestKnownEventView, self).tearDown()
-
-    @classmethod
-    def tearDownClass(cls):
-        session = Session()
-        session.query(models.User).delete()
-        session.commit()
-        session.close()
-        super(TestKnownEventView, cls).tearDownClass()
-
     def test_create_known_event(self):
         response = self.app.post(
             self.CREATE_ENDPOINT,
             data=self.known_event,
-            follow_redirects=True,
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
         self.assertEqual(self.session.query(models.KnownEvent).count(), 1)
 
     def test_create_known_event_with_end_data_earlier_than_start_date(self):
@@ -255,70 +356,50 @@ class TestKnownEventView(unittest.TestCase):
         self.assertEqual(self.session.query(models.KnownEvent).count(), 0)
 
 
-class TestPoolModelView(unittest.TestCase):
+class TestPoolModelView(TransactionalTestCase):
 
+    CLEARED_TABLES = (models.Pool,)
     CREATE_ENDPOINT = '/admin/pool/new/?url=/admin/pool/'
 
     @classmethod
     def setUpClass(cls):
         super(TestPoolModelView, cls).setUpClass()
-        session = Session()
-        session.query(models.Pool).delete()
-        session.commit()
-        session.close()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.__exit__(None, None, None)
+        super(TestPoolModelView, cls).tearDownClass()
 
     def setUp(self):
         super(TestPoolModelView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
+        self.session = settings.Session()
         self.pool = {
             'pool': 'test-pool',
             'slots': 777,
             'description': 'test-pool-description',
         }
 
-    def tearDown(self):
-        self.session.query(models.Pool).delete()
-        self.session.commit()
-        self.session.close()
-        super(TestPoolModelView, self).tearDown()
-
-    def test_create_pool(self):
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data=self.pool,
-            follow_redirects=True,
-        )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.session.query(models.Pool).count(), 1)
-
-    def test_create_pool_with_same_name(self):
-        # create test pool
-        self.app.post(
-            self.CREATE_ENDPOINT,
-            data=self.pool,
-            follow_redirects=True,
-        )
-        # create pool with the same name
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data=self.pool,
-            follow_redirects=True,
-        )
-        self.assertIn('Already exists.', response.data.decode('utf-8'))
-        self.assertEqual(self.session.query(models.Pool).count(), 1)
-
-    def test_create_pool_with_empty_name(self):
-        self.pool['pool'] = ''
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data=self.pool,
-            follow_redirects=True,
-        )
-        self.assertIn('This field is required.', response.data.decode('utf-8'))
-        self.assertEqual(self.session.query(models.Pool).count(), 0)
+    @parameterized.expand([
+        ("new_pool", {}, 1, 302, None, 1),
+        ("same_name", {}, 2, 200, 'Already exists.', 1),
+        ("empty_name", {'pool': ''}, 1, 200, 'This field is required.', 0),
+    ])
+    def test_create_pool(self, _name, overrides, times, expected_status, expected_message,
+                         expected_count):
+        # A valid pool redirects to the list view, an invalid one renders the
+        # form again with the error
+        self.pool.update(overrides)
+        for _ in range(times):
+            response = self.app.post(
+                self.CREATE_ENDPOINT,
+                data=self.pool,
+            )
+        self.assertEqual(response.status_code, expected_status)
+        if expected_message:
+            self.assertIn(expected_message, response.data.decode('utf-8'))
+        self.assertEqual(self.session.query(models.Pool).count(), expected_count)
 
 
 class TestLogView(unittest.TestCase):
@@ -330,71 +411,95 @@ class TestLogView(unittest.TestCase):
         task_id=TASK_ID,
         execution_date=DEFAULT_DATE,
     )
+    ENCODED_DATE = quote_plus(DEFAULT_DATE.isoformat())
+    EMPTY_METADATA = json.dumps({})
+    LOGS_WITH_METADATA_URL = (
+        '/admin/airflow/get_logs_with_metadata?dag_id={dag_id}&task_id={task_id}'
+        '&execution_date={execution_date}'.format(
+            dag_id=DAG_ID,
+            task_id=TASK_ID,
+            execution_date=ENCODED_DATE,
+        ) + '&try_number={try_number}&metadata={metadata}'
+    )
 
     @classmethod
     def setUpClass(cls):
         super(TestLogView, cls).setUpClass()
-        session = Session()
+        session = settings.Session()
         session.query(TaskInstance).filter(
             TaskInstance.dag_id == cls.DAG_ID and
             TaskInstance.task_id == cls.TASK_ID and
             TaskInstance.execution_date == cls.DEFAULT_DATE).delete()
         session.commit()
         session.close()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
 
-    def setUp(self):
-        super(TestLogView, self).setUp()
-        # Make sure that the configure_logging is not cached
-        self.old_modules = dict(sys.modules)
+        # The DAG is only read by the views, so it is bagged once for the class
+        from airflow.www.views import dagbag
+        dag = DAG(cls.DAG_ID, start_date=cls.DEFAULT_DATE)
+        cls.task = DummyOperator(task_id=cls.TASK_ID, dag=dag)
+        dagbag.bag_dag(dag, parent_dag=dag, root_dag=dag)
+        cls.old_modules = frozenset(sys.modules)
 
-        # Create a custom logging configuration
-        logging_config = copy.deepcopy(DEFAULT_LOGGING_CONFIG)
+        # Create a custom logging configuration, only copying the parts of
+        # the default one that are changed
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        logging_config['handlers']['task']['base_log_folder'] = os.path.normpath(
-            os.path.join(current_dir, 'test_logs'))
-        logging_config['handlers']['task']['filename_template'] = \
-            '{{ ti.dag_id }}/{{ ti.task_id }}/{{ ts | replace(":", ".") }}/{{ try_number }}.log'
+        handlers = DEFAULT_LOGGING_CONFIG['handlers']
+        logging_config = dict(DEFAULT_LOGGING_CONFIG, handlers=dict(
+            handlers,
+            task=dict(
+                handlers['task'],
+                base_log_folder=os.path.normpath(os.path.join(current_dir, 'test_logs')),
+                filename_template='{{ ti.dag_id }}/{{ ti.task_id }}/'
+                                  '{{ ts | replace(":", ".") }}/{{ try_number }}.log',
+            ),
+        ))
 
         # Write the custom logging configuration to a file
-        self.settings_folder = tempfile.mkdtemp()
-        settings_file = os.path.join(self.settings_folder, "airflow_local_settings.py")
+        cls.settings_folder = tempfile.mkdtemp()
+        settings_file = os.path.join(cls.settings_folder, "airflow_local_settings.py")
         new_logging_file = "LOGGING_CONFIG = {}".format(logging_config)
         with open(settings_file, 'w') as handle:
             handle.writelines(new_logging_file)
-        sys.path.append(self.settings_folder)
+        sys.path.append(cls.settings_folder)
+
+        # The tests only read the logs, so the logging configuration is
+        # applied once for the whole class
         conf.set('core', 'logging_config_class', 'airflow_local_settings.LOGGING_CONFIG')
+        configure_logging()
 
-        app = application.create_app(testing=True)
-        self.app = app.test_client()
-        self.session = Session()
-        from airflow.www.views import dagbag
-        dag = DAG(self.DAG_ID, start_date=self.DEFAULT_DATE)
-        task = DummyOperator(task_id=self.TASK_ID, dag=dag)
-        dagbag.bag_dag(dag, parent_dag=dag, root_dag=dag)
-        ti = TaskInstance(task=task, execution_date=self.DEFAULT_DATE)
+    def setUp(self):
+        super(TestLogView, self).setUp()
+        self.session = settings.Session()
+        ti = TaskInstance(task=self.task, execution_date=self.DEFAULT_DATE)
         ti.try_number = 1
         self.session.merge(ti)
         self.session.commit()
 
     def tearDown(self):
-        logging.config.dictConfig(DEFAULT_LOGGING_CONFIG)
         self.session.query(TaskInstance).filter(
             TaskInstance.dag_id == self.DAG_ID and
             TaskInstance.task_id == self.TASK_ID and
             TaskInstance.execution_date == self.DEFAULT_DATE).delete()
         self.session.commit()
         self.session.close()
+        super(TestLogView, self).tearDown()
 
-        # Remove any new modules imported during the test run. This lets us
-        # import the same source files for more than one test.
-        for m in [m for m in sys.modules if m not in self.old_modules]:
-            del sys.modules[m]
-
-        sys.path.remove(self.settings_folder)
-        shutil.rmtree(self.settings_folder)
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.__exit__(None, None, None)
+        logging.config.dictConfig(DEFAULT_LOGGING_CONFIG)
         conf.set('core', 'logging_config_class', '')
 
-        super(TestLogView, self).tearDown()
+        # Remove any new modules imported during the test run, so that other
+        # tests don't pick up the custom logging configuration.
+        for m in [m for m in sys.modules if m not in cls.old_modules]:
+            del sys.modules[m]
+
+        sys.path.remove(cls.settings_folder)
+        shutil.rmtree(cls.settings_folder)
+        super(TestLogView, cls).tearDownClass()
 
     def test_get_file_task_log(self):
         response = self.app.get(
@@ -406,15 +511,9 @@ class TestLogView(unittest.TestCase):
                       response.data.decode('utf-8'))
 
     def test_get_logs_with_metadata_as_download_file(self):
-        url_template = "/admin/airflow/get_logs_with_metadata?dag_id={}&" \
-                       "task_id={}&execution_date={}&" \
-                       "try_number={}&metadata={}&format=file"
         try_number = 1
-        url = url_template.format(self.DAG_ID,
-                                  self.TASK_ID,
-                                  quote_plus(self.DEFAULT_DATE.isoformat()),
-                                  try_number,
-                                  json.dumps({}))
+        url = self.LOGS_WITH_METADATA_URL.format(
+            try_number=try_number, metadata=self.EMPTY_METADATA) + "&format=file"
         response = self.app.get(url)
         expected_filename = '{}/{}/{}/{}.log'.format(self.DAG_ID,
                                                      self.TASK_ID,
@@ -434,51 +533,39 @@ class TestLogView(unittest.TestCase):
             third_return = (['3rd line'], [{'end_of_log': True}])
             fourth_return = (['should never be read'], [{'end_of_log': True}])
             read_mock.side_effect = [first_return, second_return, third_return, fourth_return]
-            url_template = "/admin/airflow/get_logs_with_metadata?dag_id={}&" \
-                           "task_id={}&execution_date={}&" \
-                           "try_number={}&metadata={}&format=file"
-            try_number = 1
-            url = url_template.format(self.DAG_ID,
-                                      self.TASK_ID,
-                                      quote_plus(self.DEFAULT_DATE.isoformat()),
-                                      try_number,
-                                      json.dumps({}))
-            response = self.app.get(url)
-
-            self.assertIn('1st line', response.data.decode('utf-8'))
-            self.assertIn('2nd line', response.data.decode('utf-8'))
-            self.assertIn('3rd line', response.data.decode('utf-8'))
-            self.assertNotIn('should never be read', response.data.decode('utf-8'))
+            url = self.LOGS_WITH_METADATA_URL.format(
+                try_number=1, metadata=self.EMPTY_METADATA) + "&format=file"
+            # Consume the streamed log chunk by chunk instead of buffering
+            # the whole download
+            response = self.app.get(url, buffered=False)
+            try:
+                data = b''.join(response.iter_encoded()).decode('utf-8')
+            finally:
+                response.close()
+
+            self.assertIn('1st line', data)
+            self.assertIn('2nd line', data)
+            self.assertIn('3rd line', data)
+            self.assertNotIn('should never be read', data)
 
     def test_get_logs_with_metadata(self):
-        url_template = "/admin/airflow/get_logs_with_metadata?dag_id={}&" \
-                       "task_id={}&execution_date={}&" \
-                       "try_number={}&metadata={}"
-        response = \
-            self.app.get(url_template.format(self.DAG_ID,
-                                             self.TASK_ID,
-                                             quote_plus(self.DEFAULT_DATE.isoformat()),
-                                             1,
-                                             json.dumps({})))
-
-        self.assertIn('"message":', response.data.decode('utf-8'))
-        self.assertIn('"metadata":', response.data.decode('utf-8'))
-        self.assertIn('Log for testing.', response.data.decode('utf-8'))
+        response = self.app.get(self.LOGS_WITH_METADATA_URL.format(
+            try_number=1, metadata=self.EMPTY_METADATA))
+
+        data = response.data.decode('utf-8')
+        self.assertIn('"message":', data)
+        self.assertIn('"metadata":', data)
+        self.assertIn('Log for testing.', data)
         self.assertEqual(200, response.status_code)
 
     def test_get_logs_with_null_metadata(self):
-        url_template = "/admin/airflow/get_logs_with_metadata?dag_id={}&" \
-                       "task_id={}&execution_date={}&" \
-                       "try_number={}&metadata=null"
-        response = \
-            self.app.get(url_template.format(self.DAG_ID,
-                                             self.TASK_ID,
-                                             quote_plus(self.DEFAULT_DATE.isoformat()),
-                                             1))
-
-        self.assertIn('"message":', response.data.decode('utf-8'))
-        self.assertIn('"metadata":', response.data.decode('utf-8'))
-        self.assertIn('Log for testing.', response.data.decode('utf-8'))
+        response = self.app.get(self.LOGS_WITH_METADATA_URL.format(
+            try_number=1, metadata='null'))
+
+        data = response.data.decode('utf-8')
+        self.assertIn('"message":', data)
+        self.assertIn('"metadata":', data)
+        self.assertIn('Log for testing.', data)
         self.assertEqual(200, response.status_code)
 
 
@@ -489,28 +576,14 @@ class TestVarImportView(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         super(TestVarImportView, cls).setUpClass()
-        session = Session()
-        session.query(models.User).delete()
-        session.commit()
-        user = models.User(username='airflow')
-        session.add(user)
-        session.commit()
-        session.close()
-
-    def setUp(self):
-        super(TestVarImportView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-
-    def tearDown(self):
-        super(TestVarImportView, self).tearDown()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
 
     @classmethod
     def tearDownClass(cls):
-        session = Session()
-        session.query(models.User).delete()
-        session.commit()
+        cls.app.__exit__(None, None, None)
+        session = settings.Session()
+        _truncate(session, models.Variable)
         session.close()
         super(TestVarImportView, cls).tearDownClass()
 
@@ -519,42 +592,37 @@ class TestVarImportView(unittest.TestCase):
             set_mock.side_effect = UnicodeEncodeError
             content = '{"fail_key": "fail_val"}'
 
-            try:
-                # python 3+
-                bytes_content = io.BytesIO(bytes(content, encoding='utf-8'))
-            except TypeError:
-                # python 2.7
-                bytes_content = io.BytesIO(bytes(content))
+            bytes_content = io.BytesIO(content.encode('utf-8'))
             response = self.app.post(
                 self.IMPORT_ENDPOINT,
                 data={'file': (bytes_content, 'test.json')},
-                follow_redirects=True
             )
-            self.assertEqual(response.status_code, 200)
-            session = Session()
-            db_dict = {x.key: x.get_val() for x in session.query(models.Variable).all()}
+            self.assertEqual(response.status_code, 302)
+            session = settings.Session()
+            db_keys = {key for key, in session.query(models.Variable.key)}
             session.close()
-            self.assertNotIn('fail_key', db_dict)
+            self.assertNotIn('fail_key', db_keys)
 
     def test_import_variables(self):
         content = ('{"str_key": "str_value", "int_key": 60,'
                    '"list_key": [1, 2], "dict_key": {"k_a": 2, "k_b": 3}}')
-        try:
-            # python 3+
-            bytes_content = io.BytesIO(bytes(content, encoding='utf-8'))
-        except TypeError:
-            # python 2.7
-            bytes_content = io.BytesIO(bytes(content))
+        bytes_content = io.BytesIO(content.encode('utf-8'))
         response = self.app.post(
             self.IMPORT_ENDPOINT,
             data={'file': (bytes_content, 'test.json')},
-            follow_redirects=True
         )
-        self.assertEqual(response.status_code, 200)
-        session = Session()
-        # Extract values from Variable
-        db_dict = {x.key: x.get_val() for x in session.query(models.Variable).all()}
+        self.assertEqual(response.status_code, 302)
+        session = settings.Session()
+        # Extract values from Variable, only selecting the columns needed to
+        # decrypt them rather than loading the whole objects. The values are
+        # still decrypted by Variable itself.
+        Var = models.Variable
+        rows = session.query(Var.key, Var._val, Var.is_encrypted).all()
         session.close()
+        db_dict = {
+            key: Var(key=key, _val=val, is_encrypted=is_encrypted).get_val()
+            for key, val, is_encrypted in rows
+        }
         self.assertIn('str_key', db_dict)
         self.assertIn('int_key', db_dict)
         self.assertIn('list_key', db_dict)
@@ -574,17 +642,13 @@ class TestVarImportView(unittest.TestCase):
 class TestMountPoint(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        # Clear cached app to remount base_url forcefully
-        application.app = None
-        with conf_vars({("webserver", "base_url"): "http://localhost:8080/test"}):
+        # Mount a fresh app on base_url, leaving the cached app of the module,
+        # if any, untouched for the other tests
+        with conf_vars({("webserver", "base_url"): "http://localhost:8080/test"}), \
+                mock.patch.object(application, 'app', None):
             app = application.cached_app(config={'WTF_CSRF_ENABLED': False}, testing=True)
             cls.client = Client(app, BaseResponse)
 
-    @classmethod
-    def tearDownClass(cls):
-        application.app = None
-        application.appbuilder = None
-
     def test_mount(self):
         # Test an endpoint that doesn't need auth!
         resp = self.client.get('/test/health')
@@ -605,52 +669,80 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         ('dag_run_for_testing_dt_nr_dr_form_2', datetime(2018, 2, 2)),
         ('dag_run_for_testing_dt_nr_dr_form_1', datetime(2018, 1, 1)),
     ]
+    RUN_OPTION_RE = re.compile(r'<option (selected )?value="([^"]+)">([^<]+)</option>')
+    # Names of the test_with_* scenarios, run by the view test classes
+    CASES = [
+        ('default_parameters',),
+        ('execution_date_parameter_only',),
+        ('base_date_and_num_runs_parmeters_only',),
+        ('base_date_and_num_runs_and_execution_date_outside',),
+        ('base_date_and_num_runs_and_execution_date_within',),
+    ]
 
     def __init__(self, test, endpoint):
         self.test = test
         self.endpoint = endpoint
 
-    def setUp(self):
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
+    @classmethod
+    def setUpClass(cls):
         from airflow.www.views import dagbag
         from airflow.utils.state import State
-        dag = DAG(self.DAG_ID, start_date=self.DEFAULT_DATE)
+        dag = DAG(cls.DAG_ID, start_date=cls.DEFAULT_DATE)
         dagbag.bag_dag(dag, parent_dag=dag, root_dag=dag)
-        self.runs = []
-        for rd in self.RUNS_DATA:
-            run = dag.create_dagrun(
+        # The DAG has no tasks, so there are no task instances to create
+        # along with the runs and they can be inserted in a single batch.
+        cls.runs = [
+            DagRun(
+                dag_id=cls.DAG_ID,
                 run_id=rd[0],
                 execution_date=rd[1],
                 state=State.SUCCESS,
                 external_trigger=True
             )
-            self.runs.append(run)
+            for rd in cls.RUNS_DATA
+        ]
+        with create_session() as session:
+            session.bulk_save_objects(cls.runs)
 
-    def tearDown(self):
-        self.session.query(DagRun).filter(
-            DagRun.dag_id == self.DAG_ID).delete()
-        self.session.commit()
-        self.session.close()
+    @classmethod
+    def tearDownClass(cls):
+        session = settings.Session()
+        session.query(DagRun).filter(
+            DagRun.dag_id == cls.DAG_ID).delete()
+        session.commit()
+        session.close()
+
+    def setUp(self):
+        self.app = self.test.app
 
     def assertBaseDateAndNumRuns(self, base_date, num_runs, data):
         self.test.assertNotIn('name="base_date" value="{}"'.format(base_date), data)
         self.test.assertNotIn('<option selected="" value="{}">{}</option>'.format(
             num_runs, num_runs), data)
 
-    def assertRunIsNotInDropdown(self, run, data):
-        self.test.assertNotIn(run.execution_date.isoformat(), data)
-        self.test.assertNotIn(run.run_id, data)
+    def getRunOptions(self, data):
+        """
+        Returns the options of the page, keyed by execution date and run id,
+        telling whether they are selected.
+        """
+        return {
+            (execution_date, run_id): bool(selected)
+            for selected, execution_date, run_id in self.RUN_OPTION_RE.findall(data)
+        }
+
+    def assertRunIsNotInDropdown(self, run, options):
+        # Would pass for any run if RUN_OPTION_RE stopped matching the page
+        self.test.assertTrue(options)
+        self.test.assertFalse(any(
+            execution_date == run.execution_date.isoformat() or run_id == run.run_id
+            for execution_date, run_id in options
+        ))
 
-    def assertRunIsInDropdownNotSelected(self, run, data):
-        self.test.assertIn('<option value="{}">{}</option>'.format(
-            run.execution_date.isoformat(), run.run_id), data)
+    def assertRunIsInDropdownNotSelected(self, run, options):
+        self.test.assertIs(options.get((run.execution_date.isoformat(), run.run_id)), False)
 
-    def assertRunIsSelected(self, run, data):
-        self.test.assertIn('<option selected value="{}">{}</option>'.format(
-            run.execution_date.isoformat(), run.run_id), data)
+    def assertRunIsSelected(self, run, options):
+        self.test.assertIs(options.get((run.execution_date.isoformat(), run.run_id)), True)
 
     def test_with_default_parameters(self):
         """
@@ -664,12 +756,13 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         )
         self.test.assertEqual(response.status_code, 200)
         data = response.data.decode('utf-8')
+        options = self.getRunOptions(data)
         self.test.assertIn('Base date:', data)
         self.test.assertIn('Number of runs:', data)
-        self.assertRunIsSelected(self.runs[0], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[1], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[2], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[3], data)
+        self.assertRunIsSelected(self.runs[0], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[1], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[2], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[3], options)
 
     def test_with_execution_date_parameter_only(self):
         """
@@ -685,14 +778,15 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         )
         self.test.assertEqual(response.status_code, 200)
         data = response.data.decode('utf-8')
+        options = self.getRunOptions(data)
         self.assertBaseDateAndNumRuns(
             self.runs[1].execution_date,
             conf.getint('webserver', 'default_dag_run_display_number'),
             data)
-        self.assertRunIsNotInDropdown(self.runs[0], data)
-        self.assertRunIsSelected(self.runs[1], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[2], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[3], data)
+        self.assertRunIsNotInDropdown(self.runs[0], options)
+        self.assertRunIsSelected(self.runs[1], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[2], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[3], options)
 
     def test_with_base_date_and_num_runs_parmeters_only(self):
         """
@@ -708,11 +802,12 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         )
         self.test.assertEqual(response.status_code, 200)
         data = response.data.decode('utf-8')
+        options = self.getRunOptions(data)
         self.assertBaseDateAndNumRuns(self.runs[1].execution_date, 2, data)
-        self.assertRunIsNotInDropdown(self.runs[0], data)
-        self.assertRunIsSelected(self.runs[1], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[2], data)
-        self.assertRunIsNotInDropdown(self.runs[3], data)
+        self.assertRunIsNotInDropdown(self.runs[0], options)
+        self.assertRunIsSelected(self.runs[1], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[2], options)
+        self.assertRunIsNotInDropdown(self.runs[3], options)
 
     def test_with_base_date_and_num_runs_and_execution_date_outside(self):
         """
@@ -730,11 +825,12 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         )
         self.test.assertEqual(response.status_code, 200)
         data = response.data.decode('utf-8')
+        options = self.getRunOptions(data)
         self.assertBaseDateAndNumRuns(self.runs[1].execution_date, 42, data)
-        self.assertRunIsNotInDropdown(self.runs[0], data)
-        self.assertRunIsSelected(self.runs[1], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[2], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[3], data)
+        self.assertRunIsNotInDropdown(self.runs[0], options)
+        self.assertRunIsSelected(self.runs[1], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[2], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[3], options)
 
     def test_with_base_date_and_num_runs_and_execution_date_within(self):
         """
@@ -752,11 +848,12 @@ class ViewWithDateTimeAndNumRunsAndDagRunsFormTester:
         )
         self.test.assertEqual(response.status_code, 200)
         data = response.data.decode('utf-8')
+        options = self.getRunOptions(data)
         self.assertBaseDateAndNumRuns(self.runs[2].execution_date, 5, data)
-        self.assertRunIsNotInDropdown(self.runs[0], data)
-        self.assertRunIsNotInDropdown(self.runs[1], data)
-        self.assertRunIsInDropdownNotSelected(self.runs[2], data)
-        self.assertRunIsSelected(self.runs[3], data)
+        self.assertRunIsNotInDropdown(self.runs[0], options)
+        self.assertRunIsNotInDropdown(self.runs[1], options)
+        self.assertRunIsInDropdownNotSelected(self.runs[2], options)
+        self.assertRunIsSelected(self.runs[3], options)
 
 
 class TestGraphView(unittest.TestCase):
@@ -766,36 +863,23 @@ class TestGraphView(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        super(TestGraphView, cls).setUpClass()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+        ViewWithDateTimeAndNumRunsAndDagRunsFormTester.setUpClass()
 
     def setUp(self):
-        super(TestGraphView, self).setUp()
         self.tester = ViewWithDateTimeAndNumRunsAndDagRunsFormTester(
             self, self.GRAPH_ENDPOINT)
         self.tester.setUp()
 
-    def tearDown(self):
-        self.tester.tearDown()
-        super(TestGraphView, self).tearDown()
-
     @classmethod
     def tearDownClass(cls):
-        super(TestGraphView, cls).tearDownClass()
-
-    def test_dt_nr_dr_form_default_parameters(self):
-        self.tester.test_with_default_parameters()
-
-    def test_dt_nr_dr_form_with_execution_date_parameter_only(self):
-        self.tester.test_with_execution_date_parameter_only()
-
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_parmeters_only(self):
-        self.tester.test_with_base_date_and_num_runs_parmeters_only()
-
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_and_execution_date_outside(self):
-        self.tester.test_with_base_date_and_num_runs_and_execution_date_outside()
+        cls.app.__exit__(None, None, None)
+        ViewWithDateTimeAndNumRunsAndDagRunsFormTester.tearDownClass()
 
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_and_execution_date_within(self):
-        self.tester.test_with_base_date_and_num_runs_and_execution_date_within()
+    @parameterized.expand(ViewWithDateTimeAndNumRunsAndDagRunsFormTester.CASES)
+    def test_dt_nr_dr_form(self, case):
+        getattr(self.tester, 'test_with_' + case)()
 
 
 class TestGanttView(unittest.TestCase):
@@ -805,66 +889,49 @@ class TestGanttView(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        super(TestGanttView, cls).setUpClass()
+        cls.app = _get_app().test_client()
+        cls.app.__enter__()
+        ViewWithDateTimeAndNumRunsAndDagRunsFormTester.setUpClass()
 
     def setUp(self):
-        super(TestGanttView, self).setUp()
         self.tester = ViewWithDateTimeAndNumRunsAndDagRunsFormTester(
             self, self.GANTT_ENDPOINT)
         self.tester.setUp()
 
-    def tearDown(self):
-        self.tester.tearDown()
-        super(TestGanttView, self).tearDown()
-
     @classmethod
     def tearDownClass(cls):
-        super(TestGanttView, cls).tearDownClass()
-
-    def test_dt_nr_dr_form_default_parameters(self):
-        self.tester.test_with_default_parameters()
-
-    def test_dt_nr_dr_form_with_execution_date_parameter_only(self):
-        self.tester.test_with_execution_date_parameter_only()
+        cls.app.__exit__(None, None, None)
+        ViewWithDateTimeAndNumRunsAndDagRunsFormTester.tearDownClass()
 
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_parmeters_only(self):
-        self.tester.test_with_base_date_and_num_runs_parmeters_only()
-
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_and_execution_date_outside(self):
-        self.tester.test_with_base_date_and_num_runs_and_execution_date_outside()
-
-    def test_dt_nr_dr_form_with_base_date_and_num_runs_and_execution_date_within(self):
-        self.tester.test_with_base_date_and_num_runs_and_execution_date_within()
+    @parameterized.expand(ViewWithDateTimeAndNumRunsAndDagRunsFormTester.CASES)
+    def test_dt_nr_dr_form(self, case):
+        getattr(self.tester, 'test_with_' + case)()
 
 
 class TestTaskInstanceView(unittest.TestCase):
-    TI_ENDPOINT = '/admin/taskinstance/?flt2_execution_date_greater_than={}'
+    TI_ENDPOINT = '/admin/taskinstance/?flt2_execution_date_greater_than=2018-10-09+22:44:31'
 
     def setUp(self):
-        super(TestTaskInstanceView, self).setUp()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
+        self.app = _get_app().test_client()
 
     def test_start_date_filter(self):
-        resp = self.app.get(self.TI_ENDPOINT.format('2018-10-09+22:44:31'))
+        resp = self.app.get(self.TI_ENDPOINT)
         # We aren't checking the logic of the date filter itself (that is built
         # in to flask-admin) but simply that our UTC conversion was run - i.e. it
         # doesn't blow up!
         self.assertEqual(resp.status_code, 200)
 
 
-class TestDeleteDag(unittest.TestCase):
+class TestDeleteDag(TransactionalTestCase):
 
     def setUp(self):
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
+        super(TestDeleteDag, self).setUp()
+        self.app = _get_app().test_client()
 
     def test_delete_dag_button_normal(self):
-        resp = self.app.get('/', follow_redirects=True)
-        self.assertIn('/delete?dag_id=example_bash_operator', resp.data.decode('utf-8'))
-        self.assertIn("return confirmDeleteDag(this, 'example_bash_operator')", resp.data.decode('utf-8'))
+        resp = self.app.get('/admin/?search=example_bash_operator')
+        self.assertIn(b'/delete?dag_id=example_bash_operator', resp.data)
+        self.assertIn(b"return confirmDeleteDag(this, 'example_bash_operator')", resp.data)
 
     def test_delete_dag_button_for_dag_on_scheduler_only(self):
         # Test for JIRA AIRFLOW-3233 (PR 4069):
@@ -874,60 +941,60 @@ class TestDeleteDag(unittest.TestCase):
         dag_id = 'example_bash_operator'
         test_dag_id = "non_existent_dag"
 
-        session = Session()
+        session = settings.Session()
         DM = models.DagModel
         dag_query = session.query(DM).filter(DM.dag_id == dag_id)
-        dag_query.first().tags = []  # To avoid "FOREIGN KEY constraint" error
-        session.commit()
-
+        # To avoid "FOREIGN KEY constraint" error, the tags are loaded along
+        # with the DAG and cleared
+        dag_query.options(joinedload(DM.tags)).one().tags = []
+        # The tags have to be deleted before the update, but both changes can
+        # go in the same transaction
+        session.flush()
         dag_query.update({'dag_id': test_dag_id})
         session.commit()
 
-        resp = self.app.get('/', follow_redirects=True)
-        self.assertIn('/delete?dag_id={}'.format(test_dag_id), resp.data.decode('utf-8'))
-        self.assertIn("return confirmDeleteDag(this, '{}')".format(test_dag_id), resp.data.decode('utf-8'))
+        resp = self.app.get('/admin/?search={}'.format(test_dag_id))
+        data = resp.data.decode('utf-8')
+        self.assertIn('/delete?dag_id={}'.format(test_dag_id), data)
+        self.assertIn("return confirmDeleteDag(this, '{}')".format(test_dag_id), data)
 
-        session.query(DM).filter(DM.dag_id == test_dag_id).update({'dag_id': dag_id})
-        session.commit()
 
+class TestRenderedView(TransactionalTestCase):
 
-class TestRenderedView(unittest.TestCase):
+    CLEARED_TABLES = (RTIF,)
+    DEFAULT_DATE = datetime(2020, 3, 1)
+    ENCODED_DATE = quote_plus(str(DEFAULT_DATE))
+    RENDERED_URL = '/admin/airflow/rendered?task_id={}&dag_id={}&execution_date=' + ENCODED_DATE
+    TASK1_URL = RENDERED_URL.format('task1', 'testdag')
+    UNEXECUTED_TASK1_URL = RENDERED_URL.format('task1', 'task1')
+    TASK2_URL = RENDERED_URL.format('task2', 'testdag')
 
-    def setUp(self):
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.default_date = datetime(2020, 3, 1)
-        self.dag = DAG(
+    @classmethod
+    def setUpClass(cls):
+        super(TestRenderedView, cls).setUpClass()
+        cls.dag = DAG(
             "testdag",
-            start_date=self.default_date,
+            start_date=cls.DEFAULT_DATE,
             user_defined_filters={"hello": lambda name: 'Hello ' + name},
             user_defined_macros={"fullname": lambda fname, lname: fname + " " + lname}
         )
-        self.task1 = BashOperator(
+        cls.task1 = BashOperator(
             task_id='task1',
             bash_command='{{ task_instance_key_str }}',
-            dag=self.dag
+            dag=cls.dag
         )
-        self.task2 = BashOperator(
+        cls.task2 = BashOperator(
             task_id='task2',
             bash_command='echo {{ fullname("Apache", "Airflow") | hello }}',
-            dag=self.dag
+            dag=cls.dag
         )
-        SerializedDagModel.write_dag(self.dag)
-        with create_session() as session:
-            session.query(RTIF).delete()
-
-    def tearDown(self):
-        super(TestRenderedView, self).tearDown()
-        with create_session() as session:
-            session.query(RTIF).delete()
+        # The views only get the DAG through the mocked get_dag, so it is
+        # serialized and deserialized in memory, without a serialized_dag row
+        cls.serialized_dag = SerializedDagModel(cls.dag).dag
 
-    def percent_encode(self, obj):
-        if PY2:
-            return urllib.quote_plus(str(obj))
-        else:
-            return urllib.parse.quote_plus(str(obj))
+    def setUp(self):
+        super(TestRenderedView, self).setUp()
+        self.app = _get_app().test_client()
 
     @mock.patch('airflow.www.views.STORE_SERIALIZED_DAGS', True)
     @mock.patch('airflow.models.taskinstance.STORE_SERIALIZED_DAGS', True)
@@ -936,19 +1003,16 @@ class TestRenderedView(unittest.TestCase):
         """
         Test that the Rendered View contains the values from RenderedTaskInstanceFields
         """
-        get_dag_function.return_value = SerializedDagModel.get(self.dag.dag_id).dag
+        get_dag_function.return_value = self.serialized_dag
 
         self.assertEqual(self.task1.bash_command, '{{ task_instance_key_str }}')
-        ti = TaskInstance(self.task1, self.default_date)
+        ti = TaskInstance(self.task1, self.DEFAULT_DATE)
 
         with create_session() as session:
             session.add(RTIF(ti))
 
-        url = ('/admin/airflow/rendered?task_id=task1&dag_id=testdag&execution_date={}'
-               .format(self.percent_encode(self.default_date)))
-
-        resp = self.app.get(url, follow_redirects=True)
-        self.assertIn("testdag__task1__20200301", resp.data.decode('utf-8'))
+        resp = self.app.get(self.TASK1_URL, follow_redirects=True)
+        self.assertIn(b"testdag__task1__20200301", resp.data)
 
     @mock.patch('airflow.www.views.STORE_SERIALIZED_DAGS', True)
     @mock.patch('airflow.models.taskinstance.STORE_SERIALIZED_DAGS', True)
@@ -958,15 +1022,12 @@ class TestRenderedView(unittest.TestCase):
         Test that the Rendered View is able to show rendered values
         even for TIs that have not yet executed
         """
-        get_dag_function.return_value = SerializedDagModel.get(self.dag.dag_id).dag
+        get_dag_function.return_value = self.serialized_dag
 
         self.assertEqual(self.task1.bash_command, '{{ task_instance_key_str }}')
 
-        url = ('/admin/airflow/rendered?task_id=task1&dag_id=task1&execution_date={}'
-               .format(self.percent_encode(self.default_date)))
-
-        resp = self.app.get(url, follow_redirects=True)
-        self.assertIn("testdag__task1__20200301", resp.data.decode('utf-8'))
+        resp = self.app.get(self.UNEXECUTED_TASK1_URL, follow_redirects=True)
+        self.assertIn(b"testdag__task1__20200301", resp.data)
 
     @mock.patch('airflow.www.views.STORE_SERIALIZED_DAGS', True)
     @mock.patch('airflow.models.taskinstance.STORE_SERIALIZED_DAGS', True)
@@ -976,16 +1037,14 @@ class TestRenderedView(unittest.TestCase):
         Test that the Rendered View is able to show rendered values
         even for TIs that have not yet executed
         """
-        get_dag_function.return_value = SerializedDagModel.get(self.dag.dag_id).dag
+        get_dag_function.return_value = self.serialized_dag
 
         self.assertEqual(self.task2.bash_command,
                          'echo {{ fullname("Apache", "Airflow") | hello }}')
 
-        url = ('/admin/airflow/rendered?task_id=task2&dag_id=testdag&execution_date={}'
-               .format(self.percent_encode(self.default_date)))
-
-        resp = self.app.get(url, follow_redirects=True)
-        self.assertNotIn("echo Hello Apache Airflow", resp.data.decode('utf-8'))
+        resp = self.app.get(self.TASK2_URL, follow_redirects=True)
+        data = resp.data.decode('utf-8')
+        self.assertNotIn("echo Hello Apache Airflow", data)
 
         if six.PY3:
             self.assertIn(
@@ -993,30 +1052,45 @@ class TestRenderedView(unittest.TestCase):
                 "when Dag Serialization is enabled. Hence for the task that have not yet "
                 "started running, please use &#39;airflow tasks render&#39; for debugging the "
                 "rendering of template_fields.<br/><br/>OriginalError: no filter named &#39;hello&#39",
-                resp.data.decode('utf-8'))
+                data)
         else:
             self.assertIn(
                 "Webserver does not have access to User-defined Macros or Filters "
                 "when Dag Serialization is enabled. Hence for the task that have not yet "
                 "started running, please use &#39;airflow tasks render&#39; for debugging the "
                 "rendering of template_fields.",
-                resp.data.decode('utf-8'))
+                data)
 
 
 @pytest.mark.quarantined
-class TestTriggerDag(unittest.TestCase):
+class TestTriggerDag(TransactionalTestCase):
+
+    CLEARED_TABLES = (models.DagRun,)
+    TRIGGER_URL = '/admin/airflow/trigger?dag_id=example_bash_operator'
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestTriggerDag, cls).setUpClass()
+        # Parsing the example DAGs is by far the slowest part of the class, so
+        # it is only done once and the DAG is synced before all the tests
+        cls.dagbag = models.DagBag(include_examples=True)
+        cls.dagbag.get_dag("example_bash_operator").sync_to_db()
+        # Like the sync above, the serialized_dag row is written in the class
+        # SAVEPOINT and rolled back in tearDownClass.
+        SerializedDagModel.write_dag(cls.dagbag.get_dag("example_bash_operator"))
+        # A DagBag reading from the serialized_dag table, for the serialized
+        # trigger path. It does not collect any file when it is created.
+        cls.serialized_dagbag = models.DagBag(store_serialized_dags=True)
+        cls.app = _get_app().test_client()
 
     def setUp(self):
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
-        self.session = Session()
-        models.DagBag().get_dag("example_bash_operator").sync_to_db()
+        super(TestTriggerDag, self).setUp()
+        self.session = settings.Session()
 
     def test_trigger_dag_button_normal_exist(self):
-        resp = self.app.get('/', follow_redirects=True)
-        self.assertIn('/trigger?dag_id=example_bash_operator', resp.data.decode('utf-8'))
-        self.assertIn("return confirmDeleteDag(this, 'example_bash_operator')", resp.data.decode('utf-8'))
+        resp = self.app.get('/admin/?search=example_bash_operator')
+        self.assertIn(b'/trigger?dag_id=example_bash_operator', resp.data)
+        self.assertIn(b"return confirmDeleteDag(this, 'example_bash_operator')", resp.data)
 
     @pytest.mark.xfail(condition=True, reason="This test might be flaky on mysql")
     def test_trigger_dag_button(self):
@@ -1024,10 +1098,8 @@ class TestTriggerDag(unittest.TestCase):
         test_dag_id = "example_bash_operator"
 
         DR = models.DagRun
-        self.session.query(DR).delete()
-        self.session.commit()
 
-        self.app.post('/admin/airflow/trigger?dag_id={}'.format(test_dag_id))
+        self.app.post(self.TRIGGER_URL)
 
         run = self.session.query(DR).filter(DR.dag_id == test_dag_id).first()
         self.assertIsNotNone(run)
@@ -1040,10 +1112,8 @@ class TestTriggerDag(unittest.TestCase):
         conf_dict = {'string': 'Hello, World!'}
 
         DR = models.DagRun
-        self.session.query(DR).delete()
-        self.session.commit()
 
-        self.app.post('/admin/airflow/trigger?dag_id={}'.format(test_dag_id),
+        self.app.post(self.TRIGGER_URL,
                       data={'conf': json.dumps(conf_dict)})
 
         run = self.session.query(DR).filter(DR.dag_id == test_dag_id).first()
@@ -1056,23 +1126,19 @@ class TestTriggerDag(unittest.TestCase):
         test_dag_id = "example_bash_operator"
 
         DR = models.DagRun
-        self.session.query(DR).delete()
-        self.session.commit()
 
-        response = self.app.post('/admin/airflow/trigger?dag_id={}'.format(test_dag_id),
+        response = self.app.post(self.TRIGGER_URL,
                                  data={'conf': '{"a": "b"'})
-        self.assertIn('Invalid JSON configuration', response.data.decode('utf-8'))
+        self.assertIn(b'Invalid JSON configuration', response.data)
 
         run = self.session.query(DR).filter(DR.dag_id == test_dag_id).first()
         self.assertIsNone(run)
 
     def test_trigger_dag_form(self):
-        test_dag_id = "example_bash_operator"
-
-        resp = self.app.get('/admin/airflow/trigger?dag_id={}'.format(test_dag_id))
+        resp = self.app.get(self.TRIGGER_URL)
 
         self.assertEqual(resp.status_code, 200)
-        self.assertIn('Trigger DAG: {}'.format(test_dag_id), resp.data.decode('utf-8'))
+        self.assertIn(b'Trigger DAG: example_bash_operator', resp.data)
 
     @mock.patch('airflow.models.dag.DAG.create_dagrun')
     def test_trigger_dag(self, mock_dagrun):
@@ -1088,14 +1154,13 @@ class TestTriggerDag(unittest.TestCase):
         )
 
         response = self.app.post(
-            '/admin/airflow/trigger?dag_id={}'.format(test_dag_id), data={}, follow_redirects=True)
+            self.TRIGGER_URL, data={}, follow_redirects=True)
         self.assertIn(
-            'Triggered example_bash_operator, it should start any moment now.',
-            response.data.decode('utf-8'))
+            b'Triggered example_bash_operator, it should start any moment now.',
+            response.data)
 
     @mock.patch('airflow.models.dag.DAG.create_dagrun')
     @mock.patch('airflow.utils.dag_processing.os.path.isfile')
-    @conf_vars({("core", "store_serialized_dags"): "True"})
     def test_trigger_serialized_dag(self, mock_os_isfile, mock_dagrun):
         mock_os_isfile.return_value = False
 
@@ -1110,11 +1175,12 @@ class TestTriggerDag(unittest.TestCase):
             state="running"
         )
 
-        response = self.app.post(
-            '/admin/airflow/trigger?dag_id={}'.format(test_dag_id), data={}, follow_redirects=True)
+        with mock.patch('airflow.www.views.dagbag', self.serialized_dagbag):
+            response = self.app.post(
+                self.TRIGGER_URL, data={}, follow_redirects=True)
         self.assertIn(
-            'Triggered example_bash_operator, it should start any moment now.',
-            response.data.decode('utf-8'))
+            b'Triggered example_bash_operator, it should start any moment now.',
+            response.data)
 
     @parameterized.expand([
         ("javascript:alert(1)", "/admin/"),
@@ -1139,75 +1205,54 @@ class TestTriggerDag(unittest.TestCase):
         ),
     ])
     def test_trigger_dag_form_origin_url(self, test_origin, expected_origin):
-        test_dag_id = "example_bash_operator"
-        response = self.app.get(
-            '/admin/airflow/trigger?dag_id={}&origin={}'.format(test_dag_id, test_origin))
+        response = self.app.get(self.TRIGGER_URL + '&origin=' + test_origin)
         self.assertIn(
             '<button class="btn" onclick="location.href = \'{}\'; return false">'.format(
                 expected_origin),
             response.data.decode('utf-8'))
 
 
-class HelpersTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        cls.app = application.create_app(testing=True)
-
-        airflow.load_login()
-        # Delay this import until here
-        import airflow.www.views as views
-        cls.views = views
-
-    def test_state_token(self):
-        # It's shouldn't possible to set these odd values anymore, but lets
-        # ensure they are escaped!
-        html = str(self.views.state_token('<script>alert(1)</script>'))
-
-        self.assertIn(
-            '&lt;script&gt;alert(1)&lt;/script&gt;',
-            html,
-        )
-        self.assertNotIn(
-            '<script>alert(1)</script>',
-            html,
-        )
+@pytest.fixture(scope="module")
+def views():
+    _get_app()
+    airflow.load_login()
+    # Delay this import until here
+    import airflow.www.views as views
+    return views
 
-    def test_task_instance_link(self):
-        mock_task = mock.Mock(dag_id='<a&1>', task_id='<b2>', execution_date=datetime(2017, 10, 12))
-        with self.app.test_request_context():
-            html = str(self.views.task_instance_link(
-                v=None, c=None, m=mock_task, p=None
-            ))
 
-        self.assertIn('%3Ca%261%3E', html)
-        self.assertIn('%3Cb2%3E', html)
-        self.assertNotIn('<a&1>', html)
-        self.assertNotIn('<b2>', html)
+def test_state_token(views):
+    # It's shouldn't possible to set these odd values anymore, but lets
+    # ensure they are escaped!
+    html = str(views.state_token('<script>alert(1)</script>'))
 
-    def test_dag_link(self):
-        mock_dag = mock.Mock(dag_id='<a&1>', execution_date=datetime(2017, 10, 12))
-        with self.app.test_request_context():
-            html = str(self.views.dag_link(
-                v=None, c=None, m=mock_dag, p=None
-            ))
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in html
+    assert '<script>alert(1)</script>' not in html
 
-        self.assertIn('%3Ca%261%3E', html)
-        self.assertNotIn('<a&1>', html)
 
-    def test_dag_run_link(self):
-        mock_run = mock.Mock(dag_id='<a&1>', run_id='<b2>', execution_date=datetime(2017, 10, 12))
-        with self.app.test_request_context():
-            html = str(self.views.dag_run_link(
-                v=None, c=None, m=mock_run, p=None
-            ))
+def test_links(views):
+    mock_task = mock.Mock(dag_id='<a&1>', task_id='<b2>', execution_date=datetime(2017, 10, 12))
+    mock_dag = mock.Mock(dag_id='<a&1>', execution_date=datetime(2017, 10, 12))
+    mock_run = mock.Mock(dag_id='<a&1>', run_id='<b2>', execution_date=datetime(2017, 10, 12))
+    # The helpers only need a request context, so a single one is pushed
+    # for all of them
+    with _get_app().test_request_context():
+        cases = [
+            (str(views.task_instance_link(v=None, c=None, m=mock_task, p=None)),
+             {'%3Ca%261%3E': '<a&1>', '%3Cb2%3E': '<b2>'}),
+            (str(views.dag_link(v=None, c=None, m=mock_dag, p=None)),
+             {'%3Ca%261%3E': '<a&1>'}),
+            (str(views.dag_run_link(v=None, c=None, m=mock_run, p=None)),
+             {'%3Ca%261%3E': '<a&1>', '%3Cb2%3E': '<b2>'}),
+        ]
 
-        self.assertIn('%3Ca%261%3E', html)
-        self.assertIn('%3Cb2%3E', html)
-        self.assertNotIn('<a&1>', html)
-        self.assertNotIn('<b2>', html)
+    for html, escaped_values in cases:
+        for escaped, raw in escaped_values.items():
+            assert escaped in html
+            assert raw not in html
 
 
-class TestConnectionModelView(unittest.TestCase):
+class TestConnectionModelView(TransactionalTestCase):
 
     CREATE_ENDPOINT = '/admin/connection/new/?url=/admin/connection/'
     CONN_ID = "new_conn"
@@ -1221,76 +1266,39 @@ class TestConnectionModelView(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         super(TestConnectionModelView, cls).setUpClass()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        cls.app = app.test_client()
+        cls.app = _get_app().test_client()
 
     def setUp(self):
-        self.session = Session()
-
-    def tearDown(self):
-        self.session.query(models.Connection) \
-                    .filter(models.Connection.conn_id == self.CONN_ID).delete()
-        self.session.commit()
-        self.session.close()
-        super(TestConnectionModelView, self).tearDown()
+        super(TestConnectionModelView, self).setUp()
+        self.session = settings.Session()
 
-    def test_create(self):
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data=self.CONN,
-            follow_redirects=True,
-        )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            self.session.query(models.Connection).filter(models.Connection.conn_id == self.CONN_ID).count(),
-            1
-        )
-
-    def test_create_error(self):
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data={"conn_type": "http"},
-            follow_redirects=True,
-        )
-        self.assertEqual(response.status_code, 200)
-        self.assertIn(b'has-error', response.data)
-        self.assertEqual(
-            self.session.query(models.Connection).filter(models.Connection.conn_id == self.CONN_ID).count(),
-            0
-        )
-
-    def test_create_extras(self):
-        data = self.CONN.copy()
-        data.update({
+    @parameterized.expand([
+        ("plain", CONN, 1, {}),
+        ("missing_conn_id", {"conn_type": "http"}, 0, {}),
+        ("extras", dict(CONN, **{
             "conn_type": "google_cloud_platform",
             "extra__google_cloud_platform__num_retries": "2",
-        })
-        response = self.app.post(
-            self.CREATE_ENDPOINT,
-            data=data,
-            follow_redirects=True,
-        )
-        self.assertEqual(response.status_code, 200)
-        conn = self.session.query(models.Connection).filter(models.Connection.conn_id == self.CONN_ID).one()
-
-        self.assertEqual(conn.extra_dejson['extra__google_cloud_platform__num_retries'], 2)
-
-    def test_create_extras_empty_field(self):
-        data = self.CONN.copy()
-        data.update({
+        }), 1, {"extra__google_cloud_platform__num_retries": 2}),
+        ("extras_empty_field", dict(CONN, **{
             "conn_type": "google_cloud_platform",
             "extra__google_cloud_platform__num_retries": "",
-        })
+        }), 1, {"extra__google_cloud_platform__num_retries": None}),
+    ])
+    def test_create(self, _name, data, expected_count, expected_extras):
         response = self.app.post(
             self.CREATE_ENDPOINT,
             data=data,
             follow_redirects=True,
         )
         self.assertEqual(response.status_code, 200)
-        conn = self.session.query(models.Connection).filter(models.Connection.conn_id == self.CONN_ID).one()
-
-        self.assertIsNone(conn.extra_dejson['extra__google_cloud_platform__num_retries'])
+        conns = self.session.query(models.Connection) \
+            .filter(models.Connection.conn_id == self.CONN_ID).all()
+        self.assertEqual(len(conns), expected_count)
+        if not expected_count:
+            self.assertIn(b'has-error', response.data)
+        for conn in conns:
+            for key, value in expected_extras.items():
+                self.assertEqual(conn.extra_dejson[key], value)
 
 
 class TestDagModelView(unittest.TestCase):
@@ -1299,9 +1307,7 @@ class TestDagModelView(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         super(TestDagModelView, cls).setUpClass()
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        cls.app = app.test_client()
+        cls.app = _get_app().test_client()
 
     def test_edit_disabled_fields(self):
         response = self.app.post(
@@ -1313,7 +1319,7 @@ class TestDagModelView(unittest.TestCase):
             follow_redirects=True,
         )
         self.assertEqual(response.status_code, 200)
-        session = Session()
+        session = settings.Session()
         DM = models.DagModel
         dm = session.query(DM).filter(DM.dag_id == 'example_bash_operator').one()
         session.close()
@@ -1322,53 +1328,58 @@ class TestDagModelView(unittest.TestCase):
         self.assertNotEqual(dm.fileloc, "/etc/passwd", "Disabled fields shouldn't be updated")
 
 
-class TestTaskStats(unittest.TestCase):
+@pytest.fixture(scope="module")
+def client():
+    return _get_app().test_client()
 
-    def setUp(self):
-        app = application.create_app(testing=True)
-        app.config['WTF_CSRF_METHODS'] = []
-        self.app = app.test_client()
 
-        models.DagBag().get_dag("example_bash_operator").sync_to_db()
-        models.DagBag().get_dag("example_subdag_operator").sync_to_db()
-        models.DagBag().get_dag('example_xcom').sync_to_db()
+@pytest.fixture(scope="module")
+def task_stats_dags():
+    dagbag = models.DagBag(include_examples=True)
+    with create_session() as session:
+        for dag_id in ('example_bash_operator', 'example_subdag_operator', 'example_xcom'):
+            dagbag.get_dag(dag_id).sync_to_db(session=session)
 
-    def test_all_dags(self):
-        resp = self.app.get('/admin/airflow/task_stats', follow_redirects=True)
-        self.assertEqual(resp.status_code, 200)
-        stats = json.loads(resp.data.decode('utf-8'))
-        self.assertIn('example_bash_operator', stats)
-        self.assertIn('example_xcom', stats)
-        self.assertEqual(set(stats['example_bash_operator'][0].keys()),
-                         {'state', 'count'})
 
-    def test_selected_dags(self):
-        resp = self.app.get(
-            '/admin/airflow/task_stats?dag_ids=example_xcom',
-            follow_redirects=True)
+@pytest.mark.usefixtures("task_stats_dags")
+def test_task_stats_all_dags(client):
+    resp = client.get('/admin/airflow/task_stats', follow_redirects=True)
+    assert resp.status_code == 200
+    stats = json.loads(resp.data.decode('utf-8'))
+    assert 'example_bash_operator' in stats
+    assert 'example_xcom' in stats
+    assert set(stats['example_bash_operator'][0].keys()) == {'state', 'count'}
 
-        self.assertEqual(resp.status_code, 200)
-        stats = json.loads(resp.data.decode('utf-8'))
-        self.assertNotIn('example_bash_operator', stats)
-        self.assertIn('example_xcom', stats)
 
-        # Multiple
-        resp = self.app.get(
-            '/admin/airflow/task_stats?dag_ids=example_xcom,example_bash_operator',
-            follow_redirects=True)
+@pytest.mark.usefixtures("task_stats_dags")
+def test_task_stats_selected_dags(client):
+    resp = client.get(
+        '/admin/airflow/task_stats?dag_ids=example_xcom',
+        follow_redirects=True)
 
-        self.assertEqual(resp.status_code, 200)
-        stats = json.loads(resp.data.decode('utf-8'))
-        self.assertIn('example_bash_operator', stats)
-        self.assertIn('example_xcom', stats)
-        self.assertNotIn('example_subdag_operator', stats)
+    assert resp.status_code == 200
+    stats = json.loads(resp.data.decode('utf-8'))
+    assert 'example_bash_operator' not in stats
+    assert 'example_xcom' in stats
 
-    def test_dag_stats(self):
-        resp = self.app.get('/admin/airflow/dag_stats', follow_redirects=True)
-        self.assertEqual(resp.status_code, 200)
-        stats = json.loads(resp.data.decode('utf-8'))
-        self.assertEqual(set(list(stats.items())[0][1][0].keys()),
-                         {'state', 'count'})
+    # Multiple
+    resp = client.get(
+        '/admin/airflow/task_stats?dag_ids=example_xcom,example_bash_operator',
+        follow_redirects=True)
+
+    assert resp.status_code == 200
+    stats = json.loads(resp.data.decode('utf-8'))
+    assert 'example_bash_operator' in stats
+    assert 'example_xcom' in stats
+    assert 'example_subdag_operator' not in stats
+
+
+@pytest.mark.usefixtures("task_stats_dags")
+def test_dag_stats(client):
+    resp = client.get('/admin/airflow/dag_stats', follow_redirects=True)
+    assert resp.status_code == 200
+    stats = json.loads(resp.data.decode('utf-8'))
+    assert set(list(stats.items())[0][1][0].keys()) == {'state', 'count'}
 
 
 if __name__ == '__main__':